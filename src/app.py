@@ -5,61 +5,175 @@ A super simple FastAPI application that allows students to view and sign up
 for extracurricular activities at Mergington High School.
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.middleware.gzip import DEFAULT_EXCLUDED_CONTENT_TYPES
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
+from pydantic import BaseModel
+from collections import ChainMap
+from types import MappingProxyType
+import hashlib
+import orjson
 import os
 from pathlib import Path
 
 app = FastAPI(title="Mergington High School API",
               description="API for viewing and signing up for extracurricular activities")
 
+# Compress larger responses such as the activities list. NDJSON streams are
+# excluded because gzip buffers chunks and would delay the first line.
+app.add_middleware(GZipMiddleware, minimum_size=500,
+                   exclude_content_types=DEFAULT_EXCLUDED_CONTENT_TYPES + ("application/x-ndjson",))
+
 # Mount the static files directory
 current_dir = Path(__file__).parent
 app.mount("/static", StaticFiles(directory=os.path.join(Path(__file__).parent,
           "static")), name="static")
 
-# In-memory activity database
-activities = {
-    
+# In-memory activity database. Participants are kept in a set for O(1)
+# membership checks and removal; they are serialized as a sorted list.
+#
+# _BASE holds the initial, read-only state. Changes are written copy-on-write
+# into _overlay, and `activities` reads through the overlay to the base, so
+# restoring the initial state only needs to clear the overlay.
+_BASE = MappingProxyType({name: MappingProxyType(details) for name, details in {
     "Chess Club": {
         "description": "Learn strategies and compete in chess tournaments",
         "schedule": "Fridays, 3:30 PM - 5:00 PM",
         "max_participants": 12,
-        "participants": ["michael@mergington.edu", "daniel@mergington.edu"]
+        "participants": frozenset({"michael@mergington.edu", "daniel@mergington.edu"})
     },
     "Programming Class": {
         "description": "Learn programming fundamentals and build software projects",
         "schedule": "Tuesdays and Thursdays, 3:30 PM - 4:30 PM",
         "max_participants": 20,
-        "participants": ["emma@mergington.edu", "sophia@mergington.edu"]
+        "participants": frozenset({"emma@mergington.edu", "sophia@mergington.edu"})
     },
     "Gym Class": {
         "description": "Physical education and sports activities",
         "schedule": "Mondays, Wednesdays, Fridays, 2:00 PM - 3:00 PM",
         "max_participants": 30,
-        "participants": ["john@mergington.edu", "olivia@mergington.edu"]
+        "participants": frozenset({"john@mergington.edu", "olivia@mergington.edu"})
     }
-}
+}.items()})
+_overlay = {}
+activities = ChainMap(_overlay, _BASE)
+
+
+class BatchSignupRequest(BaseModel):
+    emails: list[str]
+
+
+# Encoded GET /activities body and its ETag, rebuilt lazily after any mutation
+_activities_cache = None
+_activities_etag = None
+
+
+def invalidate_activities_cache():
+    """Drop the cached /activities response after the database changes"""
+    global _activities_cache, _activities_etag
+    _activities_cache = None
+    _activities_etag = None
+
+
+def _writable_participants(activity_name):
+    """Return the mutable participant set for an activity, copying it on first write"""
+    activity = _overlay.get(activity_name)
+    if activity is None:
+        base = _BASE[activity_name]
+        activity = _overlay[activity_name] = {**base, "participants": set(base["participants"])}
+    return activity["participants"]
+
+
+def restore_initial_activities():
+    """Discard all signups and unregistrations since startup"""
+    _overlay.clear()
+    invalidate_activities_cache()
 
 
 @app.get("/")
-def root():
+async def root():
     return RedirectResponse(url="/static/index.html")
 
 
+def _is_valid_email(email):
+    """Cheap structural email check: a local part, an @ and a dot after it"""
+    at = email.find("@", 1)
+    return at > 0 and email.find(".", at) != -1
+
+
+def _etag_matches(if_none_match, etag):
+    """Weakly compare an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    opaque = etag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == opaque:
+            return True
+    return False
+
+
+def _json_response(payload, status_code=200):
+    """Encode a payload with orjson, bypassing FastAPI's jsonable_encoder"""
+    return Response(content=orjson.dumps(payload), status_code=status_code,
+                    media_type="application/json")
+
+
+def _serialize_activity(details):
+    """Convert a single activity into its JSON-compatible form"""
+    return {**details, "participants": sorted(details["participants"])}
+
+
+def _serialize_activities():
+    """Convert the activities database into its JSON-compatible form"""
+    return {name: _serialize_activity(details) for name, details in activities.items()}
+
+
 @app.get("/activities")
-def get_activities():
-    return activities
+async def get_activities(request: Request):
+    global _activities_cache, _activities_etag
+    if _activities_cache is None:
+        _activities_cache = orjson.dumps(_serialize_activities())
+        _activities_etag = f'W/"{hashlib.blake2b(_activities_cache).hexdigest()}"'
+
+    headers = {"ETag": _activities_etag}
+    if _etag_matches(request.headers.get("if-none-match"), _activities_etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=_activities_cache, media_type="application/json",
+                    headers=headers)
+
+
+@app.get("/activities/stream")
+async def stream_activities():
+    """Stream activities as newline-delimited JSON, one activity per line"""
+    async def generate():
+        for name, details in list(activities.items()):
+            yield orjson.dumps({name: _serialize_activity(details)}) + b"\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@app.get("/activities/{activity_name}/participants/count")
+async def get_participant_count(activity_name: str):
+    """Get the number of students signed up for an activity"""
+    if activity_name not in activities:
+        raise HTTPException(status_code=404, detail="Activity not found")
+
+    return _json_response({"count": len(activities[activity_name]["participants"])})
 
 
 @app.post("/activities/{activity_name}/signup")
-def signup_for_activity(activity_name: str, email: str):
+async def signup_for_activity(activity_name: str, email: str):
     """Sign up a student for an activity"""
     # Validate activity exists
     if activity_name not in activities:
         raise HTTPException(status_code=404, detail="Activity not found")
 
+    if not _is_valid_email(email):
+        raise HTTPException(status_code=400, detail="Invalid email address")
+
     # Get the specific activity
     activity = activities[activity_name]
 
@@ -67,11 +181,40 @@ def signup_for_activity(activity_name: str, email: str):
     # Validate student is not already signed up
     if email in activity["participants"]:
         raise HTTPException(status_code=400, detail="Student already signed up for this activity")  
-    activity["participants"].append(email)
-    return {"message": f"Signed up {email} for {activity_name}"}
+    _writable_participants(activity_name).add(email)
+    invalidate_activities_cache()
+    return _json_response({"message": f"Signed up {email} for {activity_name}"})
+
+@app.post("/activities/{activity_name}/signup:batch")
+async def batch_signup_for_activity(activity_name: str, batch: BatchSignupRequest):
+    """Sign up several students for an activity in one request"""
+    if activity_name not in activities:
+        raise HTTPException(status_code=404, detail="Activity not found")
+
+    # Validate every email before mutating so a bad batch is not half-applied
+    invalid = [email for email in batch.emails if not _is_valid_email(email)]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid email address: {', '.join(invalid)}")
+
+    # Work out which emails are new before touching the overlay or the cache,
+    # so an empty or all-duplicate batch changes nothing
+    participants = activities[activity_name]["participants"]
+    added = set()
+    results = []
+    for email in batch.emails:
+        if email in participants or email in added:
+            results.append({"email": email, "status": "duplicate"})
+        else:
+            added.add(email)
+            results.append({"email": email, "status": "ok"})
+
+    if added:
+        _writable_participants(activity_name).update(added)
+        invalidate_activities_cache()
+    return _json_response({"results": results})
 
 @app.delete("/activities/{activity_name}/participants/{email}")
-def unregister_participant(activity_name: str, email: str):
+async def unregister_participant(activity_name: str, email: str):
     """Unregister a student from an activity"""
     if activity_name not in activities:
         raise HTTPException(status_code=404, detail="Activity not found")
@@ -81,5 +224,6 @@ def unregister_participant(activity_name: str, email: str):
     if email not in activity["participants"]:
         raise HTTPException(status_code=404, detail="Participant not found")
     
-    activity["participants"].remove(email)
-    return {"message": f"{email} has been unregistered from {activity_name}"}
\ No newline at end of file
+    _writable_participants(activity_name).discard(email)
+    invalidate_activities_cache()
+    return _json_response({"message": f"{email} has been unregistered from {activity_name}"})
\ No newline at end of file
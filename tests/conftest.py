@@ -0,0 +1,25 @@
+"""
+Shared fixtures for Mergington High School API tests
+"""
+import httpx
+import pytest_asyncio
+import sys
+from pathlib import Path
+
+# Add src directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from app import app
+
+
+@pytest_asyncio.fixture(scope="session")
+async def client():
+    """Create an in-process async client for the FastAPI app, shared across the session.
+
+    Requests go straight through ASGITransport on the test event loop, without
+    TestClient's thread portal. State isolation is handled by the
+    function-scoped reset_activities fixture.
+    """
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+        yield c
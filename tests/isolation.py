@@ -0,0 +1,59 @@
+"""
+Helpers for timing endpoints in isolated processes
+"""
+import multiprocessing
+import queue as queue_module
+import timeit
+
+
+def _time_in_child(workload, number, queue):
+    """Time the workload in this (fresh) process and report back through the queue"""
+    try:
+        queue.put((True, timeit.timeit(workload, number=number)))
+    except Exception as exc:
+        queue.put((False, exc))
+
+
+def _wait_for_result(process, queue, poll_interval):
+    """Wait for the child's report, failing if it exits without sending one"""
+    while True:
+        try:
+            return queue.get(timeout=poll_interval)
+        except queue_module.Empty:
+            if not process.is_alive():
+                # The child may have reported just before exiting
+                try:
+                    return queue.get(timeout=poll_interval)
+                except queue_module.Empty:
+                    raise RuntimeError(
+                        f"Isolated run exited with code {process.exitcode} without reporting a result"
+                    ) from None
+
+
+def run_isolated(workload, number=1, repeat=5, start_method="spawn", poll_interval=0.5):
+    """Time a workload like timeit.repeat, but in a new process per repetition.
+
+    Each repetition imports app in a fresh interpreter, so module-level state
+    such as the activities overlay and the cached /activities response cannot
+    leak between runs. The workload must be picklable, e.g. a module-level
+    function. Returns the total duration of each repetition in seconds, and
+    raises RuntimeError if a child dies without reporting.
+    """
+    context = multiprocessing.get_context(start_method)
+    durations = []
+    for _ in range(repeat):
+        queue = context.Queue()
+        process = context.Process(target=_time_in_child, args=(workload, number, queue))
+        try:
+            process.start()
+            ok, result = _wait_for_result(process, queue, poll_interval)
+        finally:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+            queue.close()
+            queue.join_thread()
+        if not ok:
+            raise result
+        durations.append(result)
+    return durations
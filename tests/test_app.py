@@ -1,239 +1,402 @@
 """
 Tests for Mergington High School API
 """
+import asyncio
+import httpx
+import os
+import orjson
 import pytest
-from fastapi.testclient import TestClient
-import sys
-from pathlib import Path
 
-# Add src directory to path
-sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+from app import activities, restore_initial_activities
+from tests.isolation import run_isolated
 
-from app import app
 
+@pytest.fixture(autouse=True)
+def reset_activities():
+    """Reset activities to initial state before each test
 
-@pytest.fixture
-def client():
-    """Create a test client for the FastAPI app"""
-    return TestClient(app)
+    Only the copy-on-write overlay is cleared; the base state is never
+    modified. The activities data is module-level and therefore process-local,
+    so when the suite is run in parallel with `pytest -n auto` (opt-in, via
+    pytest-xdist) each worker holds its own copy and tests in different
+    workers cannot interfere with one another.
+    """
+    restore_initial_activities()
 
 
-@pytest.fixture(autouse=True)
-def reset_activities():
-    """Reset activities to initial state before each test"""
-    from app import activities
-    initial_state = {
-        "Chess Club": {
-            "description": "Learn strategies and compete in chess tournaments",
-            "schedule": "Fridays, 3:30 PM - 5:00 PM",
-            "max_participants": 12,
-            "participants": ["michael@mergington.edu", "daniel@mergington.edu"]
-        },
-        "Programming Class": {
-            "description": "Learn programming fundamentals and build software projects",
-            "schedule": "Tuesdays and Thursdays, 3:30 PM - 4:30 PM",
-            "max_participants": 20,
-            "participants": ["emma@mergington.edu", "sophia@mergington.edu"]
-        },
-        "Gym Class": {
-            "description": "Physical education and sports activities",
-            "schedule": "Mondays, Wednesdays, Fridays, 2:00 PM - 3:00 PM",
-            "max_participants": 30,
-            "participants": ["john@mergington.edu", "olivia@mergington.edu"]
-        }
-    }
-    activities.clear()
-    activities.update(initial_state)
+@pytest.fixture
+async def activities_snapshot(client, reset_activities):
+    """Fetch and decode the activities list for a read-only test
+
+    Each test still makes its own request; this only removes the repeated
+    GET and decode boilerplate from the tests.
+    """
+    response = await client.get("/activities")
+    assert response.status_code == 200
+    return orjson.loads(response.content)
 
 
 class TestGetActivities:
     """Test the GET /activities endpoint"""
 
-    def test_get_activities_success(self, client):
+    async def test_get_activities_success(self, client):
         """Test retrieving all activities"""
-        response = client.get("/activities")
+        response = await client.get("/activities")
         assert response.status_code == 200
-        data = response.json()
+        data = orjson.loads(response.content)
         assert "Chess Club" in data
         assert "Programming Class" in data
         assert "Gym Class" in data
 
-    def test_get_activities_structure(self, client):
+    async def test_get_activities_structure(self, activities_snapshot):
         """Test that activities have correct structure"""
-        response = client.get("/activities")
-        data = response.json()
-        activity = data["Chess Club"]
+        activity = activities_snapshot["Chess Club"]
         assert "description" in activity
         assert "schedule" in activity
         assert "max_participants" in activity
         assert "participants" in activity
         assert isinstance(activity["participants"], list)
 
-    def test_activities_have_participants(self, client):
+    async def test_activities_have_participants(self, activities_snapshot):
         """Test that activities have participants"""
-        response = client.get("/activities")
-        data = response.json()
-        assert len(data["Chess Club"]["participants"]) == 2
-        assert "michael@mergington.edu" in data["Chess Club"]["participants"]
+        participants = activities_snapshot["Chess Club"]["participants"]
+        assert len(participants) == 2
+        assert "michael@mergington.edu" in participants
+
+    async def test_get_activities_gzipped(self, client):
+        """Test that the activities payload is gzip-compressed"""
+        response = await client.get("/activities", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert "Chess Club" in orjson.loads(response.content)
+
+    async def test_get_activities_not_modified(self, client):
+        """Test that a matching If-None-Match returns 304"""
+        response = await client.get("/activities")
+        etag = response.headers["etag"]
+        response = await client.get("/activities", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
+
+    @pytest.mark.parametrize("header", [
+        "*",
+        '"other", {etag}',
+        "{strong}",
+        ' "other" ,{strong}',
+    ])
+    async def test_get_activities_not_modified_header_forms(self, client, header):
+        """Test wildcard, lists and weak comparison in If-None-Match"""
+        etag = (await client.get("/activities")).headers["etag"]
+        strong = etag.removeprefix("W/")
+        response = await client.get(
+            "/activities",
+            headers={"If-None-Match": header.format(etag=etag, strong=strong)}
+        )
+        assert response.status_code == 304
+
+    async def test_get_activities_etag_changes_on_signup(self, client):
+        """Test that signup invalidates the cached response"""
+        etag = (await client.get("/activities")).headers["etag"]
+        await client.post(
+            "/activities/Chess Club/signup",
+            params={"email": "newstudent@mergington.edu"}
+        )
+        response = await client.get("/activities", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
+
+class TestActivitiesState:
+    """Test the copy-on-write activities database"""
+
+    def test_base_activity_is_read_only(self):
+        """Test that writing to an activity not yet copied into the overlay fails"""
+        with pytest.raises(TypeError):
+            activities["Gym Class"]["max_participants"] = 1
+        with pytest.raises(AttributeError):
+            activities["Gym Class"]["participants"].add("new@mergington.edu")
+
+
+class TestStreamActivities:
+    """Test the GET /activities/stream endpoint"""
+
+    async def test_stream_activities(self, client):
+        """Test that each activity is streamed on its own line"""
+        response = await client.get("/activities/stream", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert "content-encoding" not in response.headers
+        lines = [orjson.loads(line) for line in response.text.splitlines()]
+        assert len(lines) == 3
+        assert lines[0]["Chess Club"]["participants"] == [
+            "daniel@mergington.edu", "michael@mergington.edu"
+        ]
+
+
+class TestParticipantCount:
+    """Test the GET /activities/{activity_name}/participants/count endpoint"""
+
+    async def test_participant_count(self, client):
+        """Test retrieving the participant count"""
+        response = await client.get("/activities/Chess Club/participants/count")
+        assert response.status_code == 200
+        assert orjson.loads(response.content) == {"count": 2}
+
+    async def test_participant_count_nonexistent_activity(self, client):
+        """Test participant count for nonexistent activity"""
+        response = await client.get("/activities/Nonexistent Club/participants/count")
+        assert response.status_code == 404
+        assert "Activity not found" in orjson.loads(response.content)["detail"]
 
 
 class TestSignup:
     """Test the POST /activities/{activity_name}/signup endpoint"""
 
-    def test_signup_success(self, client):
+    async def test_signup_success(self, client):
         """Test successful signup"""
-        response = client.post(
+        response = await client.post(
             "/activities/Chess Club/signup",
             params={"email": "newstudent@mergington.edu"}
         )
         assert response.status_code == 200
-        data = response.json()
+        data = orjson.loads(response.content)
         assert "message" in data
         assert "newstudent@mergington.edu" in data["message"]
 
-    def test_signup_adds_participant(self, client):
+    async def test_signup_adds_participant(self, client):
         """Test that signup actually adds the participant"""
-        client.post(
+        await client.post(
             "/activities/Chess Club/signup",
             params={"email": "newstudent@mergington.edu"}
         )
-        response = client.get("/activities")
-        participants = response.json()["Chess Club"]["participants"]
+        response = await client.get("/activities")
+        participants = orjson.loads(response.content)["Chess Club"]["participants"]
         assert "newstudent@mergington.edu" in participants
 
-    def test_signup_duplicate_student(self, client):
+    async def test_signup_duplicate_student(self, client):
         """Test that duplicate signup fails"""
-        response = client.post(
+        response = await client.post(
             "/activities/Chess Club/signup",
             params={"email": "michael@mergington.edu"}
         )
         assert response.status_code == 400
-        data = response.json()
+        data = orjson.loads(response.content)
         assert "already signed up" in data["detail"]
 
-    def test_signup_nonexistent_activity(self, client):
+    async def test_signup_invalid_email(self, client):
+        """Test that signup rejects a malformed email"""
+        response = await client.post(
+            "/activities/Chess Club/signup",
+            params={"email": "not-an-email"}
+        )
+        assert response.status_code == 400
+        assert "Invalid email address" in orjson.loads(response.content)["detail"]
+
+    async def test_signup_nonexistent_activity(self, client):
         """Test signup for nonexistent activity"""
-        response = client.post(
+        response = await client.post(
             "/activities/Nonexistent Club/signup",
             params={"email": "student@mergington.edu"}
         )
         assert response.status_code == 404
-        data = response.json()
+        data = orjson.loads(response.content)
         assert "Activity not found" in data["detail"]
 
-    def test_signup_multiple_students(self, client):
-        """Test multiple students signing up"""
+    async def test_signup_multiple_students(self, client):
+        """Test multiple students signing up in one batch"""
         emails = ["student1@mergington.edu", "student2@mergington.edu", "student3@mergington.edu"]
-        for email in emails:
-            response = client.post(
-                "/activities/Programming Class/signup",
-                params={"email": email}
-            )
-            assert response.status_code == 200
+        response = await client.post(
+            "/activities/Programming Class/signup:batch",
+            json={"emails": emails}
+        )
+        assert response.status_code == 200
+        results = orjson.loads(response.content)["results"]
+        assert [r["email"] for r in results] == emails
+        assert all(r["status"] == "ok" for r in results)
 
-        response = client.get("/activities")
-        participants = response.json()["Programming Class"]["participants"]
+        response = await client.get("/activities")
+        participants = orjson.loads(response.content)["Programming Class"]["participants"]
         for email in emails:
             assert email in participants
 
+    async def test_batch_signup_reports_duplicates(self, client):
+        """Test that batch signup reports duplicates per email"""
+        response = await client.post(
+            "/activities/Chess Club/signup:batch",
+            json={"emails": ["michael@mergington.edu", "new@mergington.edu", "new@mergington.edu"]}
+        )
+        assert response.status_code == 200
+        statuses = [r["status"] for r in orjson.loads(response.content)["results"]]
+        assert statuses == ["duplicate", "ok", "duplicate"]
+
+    async def test_batch_signup_all_duplicates_keeps_etag(self, client, monkeypatch):
+        """Test that an all-duplicate batch leaves the cached response alone"""
+        etag = (await client.get("/activities")).headers["etag"]
+        invalidations = []
+        monkeypatch.setattr("app.invalidate_activities_cache", lambda: invalidations.append(1))
+        response = await client.post(
+            "/activities/Chess Club/signup:batch",
+            json={"emails": ["michael@mergington.edu", "daniel@mergington.edu"]}
+        )
+        statuses = [r["status"] for r in orjson.loads(response.content)["results"]]
+        assert statuses == ["duplicate", "duplicate"]
+        assert invalidations == []
+
+        response = await client.get("/activities/Chess Club/participants/count")
+        assert orjson.loads(response.content)["count"] == 2
+        response = await client.get("/activities", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
+    async def test_batch_signup_invalid_email_not_applied(self, client):
+        """Test that a batch with a malformed email adds nobody"""
+        response = await client.post(
+            "/activities/Chess Club/signup:batch",
+            json={"emails": ["valid@mergington.edu", "@mergington.edu"]}
+        )
+        assert response.status_code == 400
+        assert "@mergington.edu" in orjson.loads(response.content)["detail"]
+
+        response = await client.get("/activities/Chess Club/participants/count")
+        assert orjson.loads(response.content)["count"] == 2
+
+    async def test_batch_signup_nonexistent_activity(self, client):
+        """Test batch signup for nonexistent activity"""
+        response = await client.post(
+            "/activities/Nonexistent Club/signup:batch",
+            json={"emails": ["student@mergington.edu"]}
+        )
+        assert response.status_code == 404
+        assert "Activity not found" in orjson.loads(response.content)["detail"]
+
 
 class TestUnregister:
     """Test the DELETE /activities/{activity_name}/participants/{email} endpoint"""
 
-    def test_unregister_success(self, client):
+    async def test_unregister_success(self, client):
         """Test successful unregistration"""
-        response = client.delete(
+        response = await client.delete(
             "/activities/Chess Club/participants/michael@mergington.edu"
         )
         assert response.status_code == 200
-        data = response.json()
+        data = orjson.loads(response.content)
         assert "message" in data
         assert "unregistered" in data["message"]
 
-    def test_unregister_removes_participant(self, client):
+    async def test_unregister_removes_participant(self, client):
         """Test that unregister actually removes the participant"""
-        client.delete(
+        await client.delete(
             "/activities/Chess Club/participants/michael@mergington.edu"
         )
-        response = client.get("/activities")
-        participants = response.json()["Chess Club"]["participants"]
+        response = await client.get("/activities")
+        participants = orjson.loads(response.content)["Chess Club"]["participants"]
         assert "michael@mergington.edu" not in participants
 
-    def test_unregister_nonexistent_participant(self, client):
+    async def test_unregister_nonexistent_participant(self, client):
         """Test unregistering nonexistent participant"""
-        response = client.delete(
+        response = await client.delete(
             "/activities/Chess Club/participants/nonexistent@mergington.edu"
         )
         assert response.status_code == 404
-        data = response.json()
+        data = orjson.loads(response.content)
         assert "Participant not found" in data["detail"]
 
-    def test_unregister_nonexistent_activity(self, client):
+    async def test_unregister_nonexistent_activity(self, client):
         """Test unregistering from nonexistent activity"""
-        response = client.delete(
+        response = await client.delete(
             "/activities/Nonexistent Club/participants/michael@mergington.edu"
         )
         assert response.status_code == 404
-        data = response.json()
+        data = orjson.loads(response.content)
         assert "Activity not found" in data["detail"]
 
-    def test_unregister_then_signup_again(self, client):
+    async def test_unregister_then_signup_again(self, client):
         """Test that a student can sign up again after unregistering"""
         # Unregister
-        client.delete(
+        await client.delete(
             "/activities/Chess Club/participants/michael@mergington.edu"
         )
         # Sign up again
-        response = client.post(
+        response = await client.post(
             "/activities/Chess Club/signup",
             params={"email": "michael@mergington.edu"}
         )
         assert response.status_code == 200
         # Verify participant is back
-        response = client.get("/activities")
-        participants = response.json()["Chess Club"]["participants"]
+        response = await client.get("/activities")
+        participants = orjson.loads(response.content)["Chess Club"]["participants"]
         assert "michael@mergington.edu" in participants
 
 
 class TestIntegration:
     """Integration tests combining multiple operations"""
 
-    def test_signup_and_unregister_workflow(self, client):
+    async def test_signup_and_unregister_workflow(self, client):
         """Test complete workflow: signup and then unregister"""
         # Initial state
-        response = client.get("/activities")
-        initial_count = len(response.json()["Programming Class"]["participants"])
+        response = await client.get("/activities/Programming Class/participants/count")
+        initial_count = orjson.loads(response.content)["count"]
 
         # Sign up
-        client.post(
+        await client.post(
             "/activities/Programming Class/signup",
             params={"email": "workflow@mergington.edu"}
         )
 
         # Verify signup
-        response = client.get("/activities")
-        after_signup = len(response.json()["Programming Class"]["participants"])
+        response = await client.get("/activities/Programming Class/participants/count")
+        after_signup = orjson.loads(response.content)["count"]
         assert after_signup == initial_count + 1
 
         # Unregister
-        client.delete(
+        await client.delete(
             "/activities/Programming Class/participants/workflow@mergington.edu"
         )
 
         # Verify unregister
-        response = client.get("/activities")
-        after_unregister = len(response.json()["Programming Class"]["participants"])
+        response = await client.get("/activities/Programming Class/participants/count")
+        after_unregister = orjson.loads(response.content)["count"]
         assert after_unregister == initial_count
 
-    def test_all_activities_accessible(self, client):
+    async def test_all_activities_accessible(self, activities_snapshot):
         """Test that all activities are accessible and valid"""
-        response = client.get("/activities")
-        assert response.status_code == 200
-        activities = response.json()
-
-        for activity_name, activity_data in activities.items():
+        for activity_name, activity_data in activities_snapshot.items():
             assert activity_name is not None
             assert activity_data["description"]
             assert activity_data["schedule"]
             assert activity_data["max_participants"] > 0
             assert isinstance(activity_data["participants"], list)
+
+
+def _signup_workload():
+    """Sign up a fixed student; fails if state leaked in from an earlier run"""
+    from app import app
+
+    async def signup():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            response = await c.post(
+                "/activities/Chess Club/signup",
+                params={"email": "benchmark@mergington.edu"}
+            )
+            assert response.status_code == 200
+
+    asyncio.run(signup())
+
+
+def _crashing_workload():
+    """Exit the child process without reporting a result"""
+    os._exit(1)
+
+
+class TestIsolatedTiming:
+    """Test the spawn-per-repetition timing helper"""
+
+    def test_run_isolated_starts_from_fresh_state(self):
+        """Test that each repetition sees the initial activities state"""
+        durations = run_isolated(_signup_workload, number=1, repeat=2)
+        assert len(durations) == 2
+        assert all(d > 0 for d in durations)
+
+    def test_run_isolated_child_dies_without_reporting(self):
+        """Test that a child exiting abruptly raises instead of hanging"""
+        with pytest.raises(RuntimeError, match="exited with code 1"):
+            run_isolated(_crashing_workload, number=1, repeat=1)